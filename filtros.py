@@ -0,0 +1,603 @@
+# -*- coding: utf-8 -*-
+"""Filtros de imagen para SurrealCam.
+
+Cada filtro recibe la ruta de la foto original y la ruta de salida,
+redimensiona la imagen a 800x600 y guarda el resultado como JPEG.
+"""
+
+import gc
+import math
+import os
+import shutil
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image, ImageOps
+from scipy import ndimage
+
+# Pillow-SIMD se versiona como "9.0.0.post1": el sufijo "post" delata la
+# build vectorizada, con la que el remuestreo LANCZOS es lo bastante
+# barato como para usarlo por defecto en todos los filtros.
+_HAS_SIMD = "post" in getattr(Image, "__version__", "")
+_DEFAULT_RESAMPLE = (Image.Resampling.LANCZOS if _HAS_SIMD
+                     else Image.Resampling.BILINEAR)
+
+# Generador persistente (PCG64): mas rapido por extraccion que el estado
+# global Mersenne Twister y permite pedir dtypes concretos sin conversiones.
+_rng = np.random.default_rng()
+
+try:
+    from numba import njit, prange, types
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
+
+
+if HAS_NUMBA:
+    @njit('void(uint8[:, :, ::1], uint8[:, :, ::1], int64, int64, '
+          'float64, float64)', cache=True, parallel=True, fastmath=True)
+    def _espiral_kernel(img, out, cx, cy, inv_max_r, intensidad):
+        """Remapea cada pixel girandolo alrededor del centro (compilado)."""
+        h, w = img.shape[:2]
+        for y in prange(h):
+            for x in range(w):
+                dx = x - cx
+                dy = y - cy
+                dist = math.sqrt(dx * dx + dy * dy)
+                angle = math.atan2(dy, dx) + dist * inv_max_r * intensidad
+                sx = int(cx + dist * math.cos(angle))
+                sy = int(cy + dist * math.sin(angle))
+                if 0 <= sx < w and 0 <= sy < h:
+                    out[y, x, 0] = img[sy, sx, 0]
+                    out[y, x, 1] = img[sy, sx, 1]
+                    out[y, x, 2] = img[sy, sx, 2]
+
+    # np.asarray sobre una imagen PIL da un array de solo lectura; la
+    # firma tiene que declararlo o el dispatcher eager no encuentra
+    # especializacion y el filtro caeria al except sin aplicar nada
+    _RGB_RO = types.Array(types.uint8, 3, 'C', readonly=True)
+
+    @njit(types.void(_RGB_RO, types.uint8[:, :, ::1],
+                     types.int64, types.int64),
+          cache=True, parallel=True, fastmath=True)
+    def _grano_kernel(img, out, intensidad, seed):
+        """Grano analogico en una sola pasada: lum, ruido, escala y clip."""
+        h, w = img.shape[:2]
+        span = 2 * intensidad + 1
+        mask64 = 0xFFFFFFFFFFFFFFFF
+        for y in prange(h):
+            # xorshift64 con estado propio por fila para poder paralelizar
+            state = (seed ^ ((y + 1) * 2654435761)) & mask64
+            for x in range(w):
+                state ^= (state << 13) & mask64
+                state ^= state >> 7
+                state ^= (state << 17) & mask64
+                noise = int(state % span) - intensidad
+
+                lum = (int(img[y, x, 0]) + int(img[y, x, 1]) +
+                       int(img[y, x, 2])) / 765.0
+                delta = int(noise * (0.5 + 0.5 * lum))
+                for c in range(3):
+                    v = int(img[y, x, c]) + delta
+                    if v < 0:
+                        v = 0
+                    elif v > 255:
+                        v = 255
+                    out[y, x, c] = v
+
+    # Con firma explicita los kernels se compilan al importar y, gracias a
+    # cache=True, las importaciones siguientes cargan el objeto compilado
+    # de __pycache__ en vez de volver a pasar por el JIT.
+
+
+def _espiral_remap(img_array, out, cx, cy, inv_max_r, intensidad):
+    """Version vectorizada del remolino con remuestreo bilineal."""
+    h, w = img_array.shape[:2]
+    ys, xs = np.mgrid[0:h, 0:w].astype(np.float32)
+    dx = xs - cx
+    dy = ys - cy
+    dist = np.hypot(dx, dy)
+    angle = np.arctan2(dy, dx) + dist * inv_max_r * intensidad
+    sx = cx + dist * np.cos(angle)
+    sy = cy + dist * np.sin(angle)
+    for c in range(3):
+        out[:, :, c] = ndimage.map_coordinates(
+            img_array[:, :, c], [sy, sx], order=1, mode="constant", cval=0)
+
+
+def _inplace_hshift(arr, k):
+    """Desplazamiento circular horizontal sin copiar el array entero.
+
+    Equivale a arr[:] = np.roll(arr, k, axis=1) pero solo copia una franja
+    de |k| columnas en lugar de un buffer temporal completo.
+    """
+    k %= arr.shape[1]
+    if k == 0:
+        return
+    tmp = arr[:, -k:].copy()
+    arr[:, k:] = arr[:, :-k]
+    arr[:, :k] = tmp
+
+
+# Las pasadas NumPy por filas escalan bien en los 4 nucleos del Pi Zero 2W
+# porque NumPy suelta el GIL; los kernels Numba ya paralelizan por su cuenta.
+_N_WORKERS = min(4, os.cpu_count() or 1)
+_EXECUTOR = ThreadPoolExecutor(_N_WORKERS)
+
+
+def _row_parallel(fn, *arrays):
+    """Aplica fn a franjas horizontales de arrays y concatena el resultado.
+
+    Si fn escribe sobre sus argumentos y devuelve None no se concatena
+    nada: el resultado ya esta en los buffers que se le pasaron.
+    """
+    if _N_WORKERS <= 1:
+        return fn(*arrays)
+    parts = [np.array_split(a, _N_WORKERS, axis=0) for a in arrays]
+    tiles = list(_EXECUTOR.map(lambda args: fn(*args), zip(*parts)))
+    if tiles[0] is None:
+        return None
+    return np.concatenate(tiles, axis=0)
+
+
+def _tiled(arr, tile_rows=128):
+    """Genera franjas (y0, y1, vista) de ~128 filas.
+
+    A 800 de ancho una franja son ~300 KB: varias pasadas sobre la misma
+    franja se quedan en L2 en vez de recorrer DRAM una vez por pasada.
+    """
+    h = arr.shape[0]
+    for y0 in range(0, h, tile_rows):
+        y1 = min(y0 + tile_rows, h)
+        yield y0, y1, arr[y0:y1]
+
+
+# Buffers de salida reutilizados entre llamadas: a 800x600x3 cada filtro
+# pedia ~1.4 MB nuevos al allocator en cada foto.
+_SCRATCH = {}
+
+
+def _scratch(shape, dtype=np.uint8, clear=False):
+    """Devuelve un buffer cacheado por (shape, dtype), opcionalmente a cero."""
+    key = (shape, np.dtype(dtype).str)
+    arr = _SCRATCH.get(key)
+    if arr is None:
+        arr = np.empty(shape, dtype)
+        _SCRATCH[key] = arr
+    if clear:
+        arr.fill(0)
+    return arr
+
+
+def check_disk_space(path="/home/fotos", min_mb=50):
+    """Comprueba que quede espacio libre en el disco."""
+    try:
+        stat = os.statvfs(path)
+        free_mb = (stat.f_bavail * stat.f_frsize) / (1024 * 1024)
+        return free_mb > min_mb
+    except OSError:
+        return True
+
+
+# Pesos ITU-R 601 en Q8 (77+150+29 = 256, el normalizador es un shift)
+_BT601_Q8 = np.array([77, 150, 29], dtype=np.uint16)
+
+
+def _gray_array(image):
+    """Gris ITU-R 601 en uint8 sin pasar por image.convert('L')."""
+    rgb = np.asarray(image)
+    return ((rgb @ _BT601_Q8) >> 8).astype(np.uint8)
+
+
+# Tablas sepia (0.8 y 0.5 en Q8) precalculadas una vez
+_SEPIA_LUT_G = ((np.arange(256) * 205) >> 8).astype(np.uint8)
+_SEPIA_LUT_B = ((np.arange(256) * 128) >> 8).astype(np.uint8)
+
+# Divisiones enteras de los filtros matrix: /3 y /6 por tabla (no son
+# potencias de dos), /8 y /16 como desplazamientos
+_DIV3_LUT = (np.arange(256) // 3).astype(np.uint8)
+_DIV6_LUT = (np.arange(256) // 6).astype(np.uint8)
+
+# Cache LRU de imagenes ya decodificadas y reducidas (ver load_and_resize)
+_RESIZE_CACHE = OrderedDict()
+_RESIZE_CACHE_MAX = 4
+
+
+def cleanup_memory():
+    """Fuerza una pasada del recolector de basura."""
+    gc.collect()
+
+
+def load_and_resize(input_path, max_size=(800, 600),
+                    resample=_DEFAULT_RESAMPLE):
+    """Abre la imagen y la reduce a max_size manteniendo proporciones.
+
+    BILINEAR por defecto con Pillow normal: para los filtros destructivos
+    (grano, glitch, matrix...) no se nota frente a LANCZOS y cuesta un
+    tercio. Con Pillow-SIMD instalada, LANCZOS pasa a ser el defecto.
+
+    El resultado se cachea por (ruta, mtime, tamano, filtro): probar
+    varios filtros sobre la misma foto solo decodifica el JPEG una vez.
+    """
+    try:
+        key = (input_path, os.path.getmtime(input_path), max_size, resample)
+    except OSError:
+        key = None
+    if key is not None and key in _RESIZE_CACHE:
+        _RESIZE_CACHE.move_to_end(key)
+        return _RESIZE_CACHE[key].copy()
+
+    with Image.open(input_path) as img:
+        # Para JPEG pide a libjpeg que decodifique ya reducido (1/2, 1/4
+        # o 1/8); en otros formatos draft() no hace nada.
+        img.draft("RGB", max_size)
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+        img_copy = img.copy()
+    # reducing_gap deja que Pillow reduzca primero con un filtro de caja
+    # barato y aplique el filtro bueno solo en el ultimo tramo
+    img_copy.thumbnail(max_size, resample, reducing_gap=3.0)
+
+    if key is not None:
+        _RESIZE_CACHE[key] = img_copy
+        while len(_RESIZE_CACHE) > _RESIZE_CACHE_MAX:
+            _RESIZE_CACHE.popitem(last=False)
+        return img_copy.copy()
+    return img_copy
+
+
+def _save_jpeg(img, path, quality=85, optimize=False):
+    """Guardado JPEG rapido: 4:2:0 y sin la segunda pasada de Huffman.
+
+    optimize=True duplica el tiempo de codificacion para ganar unos KB;
+    solo merece la pena en una exportacion final, no en cada filtro.
+    Con Pillow-SIMD/libjpeg-turbo usa las tablas "web_high" ya afinadas,
+    que compensan de sobra la pasada de optimizacion que se omite.
+    """
+    if _HAS_SIMD and not optimize:
+        img.save(path, qtables="web_high", optimize=False,
+                 progressive=False, subsampling=2)
+    else:
+        img.save(path, quality=quality, optimize=optimize,
+                 progressive=False, subsampling=2)
+
+
+class FilterContext:
+    """Mantiene la foto decodificada para encadenar varios filtros.
+
+    Todos los filtros aceptan un FilterContext en lugar de la ruta de
+    entrada: la JPEG se decodifica y reduce una sola vez aunque se
+    apliquen N filtros seguidos (vista previa del menu).
+    """
+
+    def __init__(self, path, max_size=(800, 600)):
+        self.path = path
+        self.max_size = max_size
+        self._images = {}
+
+    def image(self, max_size=None, resample=_DEFAULT_RESAMPLE):
+        """Imagen reducida, cacheada por (tamano, filtro de reescalado)."""
+        key = (max_size or self.max_size, resample)
+        img = self._images.get(key)
+        if img is None:
+            img = load_and_resize(self.path, key[0], resample)
+            self._images[key] = img
+        return img
+
+    @property
+    def rgb(self):
+        return np.asarray(self.image())
+
+
+def _ctx_image(source, max_size, resample=_DEFAULT_RESAMPLE):
+    """Acepta una ruta o un FilterContext y devuelve la imagen lista."""
+    if isinstance(source, FilterContext):
+        return source.image(max_size, resample)
+    return load_and_resize(source, max_size, resample)
+
+
+def _ctx_path(source):
+    """Ruta en disco del original, venga como cadena o como contexto."""
+    return source.path if isinstance(source, FilterContext) else source
+
+
+def filtro_normal(input_path, output_path):
+    """Sin filtro: enlaza (o copia) la foto tal cual."""
+    # Un hard link no mueve datos; si el destino ya existe o esta en otro
+    # sistema de ficheros, copia de toda la vida.
+    input_path = _ctx_path(input_path)
+    try:
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        os.link(input_path, output_path)
+    except OSError:
+        shutil.copyfile(_ctx_path(input_path), output_path)
+
+
+def filtro_grano_analogico(input_path, output_path, intensidad=20, max_size=(800, 600)):
+    """Grano tipo pelicula analogica, mas fuerte en las zonas claras."""
+    try:
+        image = _ctx_image(input_path, max_size)
+        img_array = np.asarray(image)
+
+        if HAS_NUMBA:
+            noisy_image = _scratch(img_array.shape)
+            _grano_kernel(img_array, noisy_image, intensidad,
+                          _rng.integers(1, 1 << 31))
+        else:
+            # Luminancia y escala en punto fijo: (r+2g+b)/4 como aproximacion
+            # de la media, y escala 0.5+0.5*lum en Q8 (128..255).
+            r16 = img_array[:, :, 0].astype(np.uint16)
+            g16 = img_array[:, :, 1].astype(np.uint16)
+            b16 = img_array[:, :, 2].astype(np.uint16)
+            lum_u8 = ((r16 + 2 * g16 + b16) >> 2).astype(np.uint8)
+            scale_q8 = (128 + (lum_u8 >> 1)).astype(np.uint16)
+            noise = _rng.integers(-intensidad, intensidad + 1,
+                                  lum_u8.shape, dtype=np.int16)
+            noise_scaled = ((noise * scale_q8) >> 8).astype(np.int16)
+
+            # Mezcla sin temporales: suma y clip sobre un scratch int16 y
+            # vuelta a uint8 copiando en el buffer de salida, todo con out=.
+            tmp16 = _scratch(img_array.shape, np.int16)
+            noisy_image = _scratch(img_array.shape)
+
+            def _mezcla(img, ns, tmp, out):
+                np.add(img, ns[:, :, None], out=tmp)
+                np.clip(tmp, 0, 255, out=tmp)
+                np.copyto(out, tmp, casting="unsafe")
+
+            _row_parallel(_mezcla, img_array, noise_scaled, tmp16,
+                          noisy_image)
+
+        result = Image.fromarray(noisy_image)
+        _save_jpeg(result, output_path)
+    except Exception:
+        shutil.copyfile(_ctx_path(input_path), output_path)
+
+
+def filtro_glitch_digital(input_path, output_path, max_size=(800, 600)):
+    """Glitch digital: desplaza el canal rojo y unas franjas al azar."""
+    try:
+        image = _ctx_image(input_path, max_size)
+        img_array = np.array(image)
+        h, w = img_array.shape[:2]
+
+        # Acumula los desplazamientos de franja en un mapa de columnas y
+        # aplica todos con un unico gather, en vez de 15 np.roll con copia.
+        glitch_lines = _rng.integers(5, 15)
+        col_idx = np.broadcast_to(np.arange(w), (h, w)).copy()
+        for _ in range(min(glitch_lines, 15)):
+            y = _rng.integers(0, h - 10)
+            y_end = y + _rng.integers(2, 8)
+            x_offset = _rng.integers(-30, 30)
+            col_idx[y:y_end] = (col_idx[y:y_end] - x_offset) % w
+        img_array = np.take_along_axis(img_array, col_idx[:, :, None], axis=1)
+
+        # Aberracion cromatica del canal rojo, aplicada despues de las
+        # franjas para que estas no la pisen
+        offset = _rng.integers(5, 20)
+        _inplace_hshift(img_array[:, :, 0], offset)
+
+        result = Image.fromarray(img_array)
+        _save_jpeg(result, output_path)
+    except Exception:
+        shutil.copyfile(_ctx_path(input_path), output_path)
+
+
+# Banda "L" a cero por tamano, compartida entre los filtros de tinte
+# (Image.merge copia las bandas, asi que reutilizarla es seguro)
+_ZERO_L = {}
+
+
+def _zero_band(size):
+    band = _ZERO_L.get(size)
+    if band is None:
+        band = Image.new("L", size, 0)
+        _ZERO_L[size] = band
+    return band
+
+
+def _filtro_tinte(input_path, output_path, channel_idx, max_size=(800, 600)):
+    """Vuelca la imagen en gris sobre un unico canal RGB."""
+    try:
+        image = _ctx_image(input_path, max_size)
+        gray = image.convert("L")
+        zero = _zero_band(gray.size)
+
+        bands = [zero, zero, zero]
+        bands[channel_idx] = gray
+        result = Image.merge("RGB", tuple(bands))
+        _save_jpeg(result, output_path)
+    except Exception:
+        shutil.copyfile(_ctx_path(input_path), output_path)
+
+
+def filtro_rojo_contraste(input_path, output_path, max_size=(800, 600)):
+    """Blanco y negro volcado al canal rojo."""
+    _filtro_tinte(input_path, output_path, 0, max_size)
+
+
+def filtro_azul_contraste(input_path, output_path, max_size=(800, 600)):
+    """Blanco y negro volcado al canal azul."""
+    _filtro_tinte(input_path, output_path, 2, max_size)
+
+
+def filtro_sepia_contraste(input_path, output_path, max_size=(800, 600)):
+    """Sepia clasico a partir de la imagen en escala de grises."""
+    try:
+        image = _ctx_image(input_path, max_size,
+                           resample=Image.Resampling.LANCZOS)
+        gray_array = _gray_array(image)
+
+        # Canales por tabla: 256 entradas en cache frente a multiplicar
+        # cada pixel. El canal rojo con factor 1.0 es el gris tal cual.
+        sepia_array = _scratch(gray_array.shape + (3,))
+        for y0, y1, strip in _tiled(gray_array):
+            sepia_array[y0:y1, :, 0] = strip
+            sepia_array[y0:y1, :, 1] = _SEPIA_LUT_G[strip]
+            sepia_array[y0:y1, :, 2] = _SEPIA_LUT_B[strip]
+
+        result = Image.fromarray(sepia_array)
+        _save_jpeg(result, output_path)
+    except Exception:
+        shutil.copyfile(_ctx_path(input_path), output_path)
+
+
+def filtro_negativo(input_path, output_path, max_size=(800, 600)):
+    """Negativo de la imagen."""
+    try:
+        image = _ctx_image(input_path, max_size)
+        result = ImageOps.invert(image)
+        _save_jpeg(result, output_path)
+    except Exception:
+        shutil.copyfile(_ctx_path(input_path), output_path)
+
+
+# La cadena contraste 0.85 -> brillo 1.15 -> ganancia por canal -> velo
+# rosado al 10% es afin, asi que se pliega a result = img * A + B con A y B
+# precalculados por canal.
+_WES_GAIN = np.array([1.08, 1.05, 0.95], dtype=np.float32)
+_WES_A = (0.85 * 1.15 * 0.9) * _WES_GAIN
+_WES_B = ((128.0 - 128.0 * 0.85) * 1.15 * 0.9) * _WES_GAIN + \
+    0.1 * np.array([255.0, 200.0, 200.0], dtype=np.float32)
+# ...y de ahi a una LUT uint8 de 256 entradas por canal: el filtro queda en
+# puras lecturas de tabla, sin pasar por float32.
+_WES_LUT = np.clip(np.arange(256, dtype=np.float32)[:, None] * _WES_A +
+                   _WES_B, 0, 255).astype(np.uint8)
+
+
+def filtro_wes_anderson(input_path, output_path, max_size=(800, 600)):
+    """Paleta pastel simetrica tipo Wes Anderson."""
+    try:
+        image = _ctx_image(input_path, max_size,
+                           resample=Image.Resampling.LANCZOS)
+        img_array = np.array(image)
+
+        result_array = _row_parallel(lambda a: _WES_LUT[a, np.arange(3)],
+                                     img_array)
+        result = Image.fromarray(result_array)
+        _save_jpeg(result, output_path)
+    except Exception:
+        shutil.copyfile(_ctx_path(input_path), output_path)
+
+
+def filtro_espiral(input_path, output_path, intensidad=2.5, max_size=(800, 600)):
+    """Remolino: retuerce la imagen alrededor del centro."""
+    try:
+        image = _ctx_image(input_path, max_size)
+        img_array = np.array(image)
+        h, w = img_array.shape[:2]
+
+        cx = w // 2
+        cy = h // 2
+        max_r = math.sqrt(cx * cx + cy * cy)
+
+        output_array = _scratch(img_array.shape, clear=True)
+        if HAS_NUMBA:
+            _espiral_kernel(img_array, output_array, cx, cy, 1.0 / max_r,
+                            intensidad)
+        else:
+            _espiral_remap(img_array, output_array, cx, cy, 1.0 / max_r,
+                           intensidad)
+
+        result = Image.fromarray(output_array)
+        _save_jpeg(result, output_path)
+    except Exception:
+        shutil.copyfile(_ctx_path(input_path), output_path)
+
+
+def filtro_matrix_simple(input_path, output_path, max_size=(800, 600)):
+    """Tinte verde Matrix con puntos brillantes al azar."""
+    try:
+        image = _ctx_image(input_path, max_size)
+        gray_array = _gray_array(image)
+        h, w = gray_array.shape
+
+        matrix_array = _scratch((h, w, 3))
+        for y0, y1, strip in _tiled(gray_array):
+            matrix_array[y0:y1, :, 0] = _DIV3_LUT[strip]
+            matrix_array[y0:y1, :, 1] = strip
+            matrix_array[y0:y1, :, 2] = _DIV6_LUT[strip]
+
+        # Puntos brillantes dispersos, sorteados todos de una vez
+        n = w * h // 100
+        xs = _rng.integers(0, w, n)
+        ys = _rng.integers(0, h, n)
+        mask = matrix_array[ys, xs, 1] < 200
+        ys, xs = ys[mask], xs[mask]
+        matrix_array[ys, xs, 0] = 100
+        matrix_array[ys, xs, 1] = 255
+        matrix_array[ys, xs, 2] = 100
+
+        result = Image.fromarray(matrix_array)
+        _save_jpeg(result, output_path)
+    except Exception:
+        shutil.copyfile(_ctx_path(input_path), output_path)
+
+
+def filtro_matrix_verde(input_path, output_path, max_size=(800, 600)):
+    """Lluvia de codigo verde sobre las zonas oscuras de la foto."""
+    try:
+        image = _ctx_image(input_path, max_size)
+        gray_array = _gray_array(image)
+        h, w = gray_array.shape
+
+        matrix_array = _scratch((h, w, 3))
+        for y0, y1, strip in _tiled(gray_array):
+            matrix_array[y0:y1, :, 0] = np.right_shift(strip, 3)
+            matrix_array[y0:y1, :, 1] = strip
+            matrix_array[y0:y1, :, 2] = np.right_shift(strip, 4)
+
+        # Celdas de "codigo" en las zonas oscuras, calculadas en bloque:
+        # una media por celda, una mascara de celdas oscuras con suerte y
+        # una escritura vectorizada por tipo de patron.
+        cell_h = 3
+        cell_w = 2
+        nb_y = h // cell_h
+        nb_x = w // cell_w
+        block_mean = (gray_array[:nb_y * cell_h, :nb_x * cell_w]
+                      .reshape(nb_y, cell_h, nb_x, cell_w)
+                      .mean(axis=(1, 3)))
+        rand = _rng.random((nb_y, nb_x))
+        pattern = _rng.integers(1, 5, (nb_y, nb_x))
+        mask = (rand < 0.15) & (block_mean < 100)
+
+        by, bx = np.nonzero(mask)
+        ys = by * cell_h
+        xs = bx * cell_w
+        ptype = pattern[by, bx]
+
+        # Patron 1: un pixel central
+        sel = ptype == 1
+        matrix_array[ys[sel] + 1, xs[sel], 1] = 255
+        # Patrones 2 y 3: columna vertical (izquierda o derecha)
+        for p, dx in ((2, 0), (3, 1)):
+            sel = ptype == p
+            yy = (ys[sel][:, None] + np.arange(cell_h)).ravel()
+            xx = np.repeat(xs[sel] + dx, cell_h)
+            matrix_array[yy, xx, 1] = 255
+        # Patron 4: diagonal
+        sel = ptype == 4
+        diag = min(cell_h, cell_w)
+        yy = (ys[sel][:, None] + np.arange(diag)).ravel()
+        xx = (xs[sel][:, None] + np.arange(diag)).ravel()
+        matrix_array[yy, xx, 1] = 255
+
+        # Lluvia vertical: todas las gotas sorteadas en bloque y escritas
+        # con un unico scatter enmascarado por longitud
+        n_drops = h // 25
+        len_hi = min(60, int(h // 1.5))
+        xs = _rng.integers(0, w, n_drops)
+        lengths = _rng.integers(20, len_hi, n_drops)
+        starts = _rng.integers(0, h - len_hi + 1, n_drops)
+        offs = np.arange(len_hi)
+        ys = starts[:, None] + offs[None, :]
+        xx = np.broadcast_to(xs[:, None], ys.shape)
+        valid = offs[None, :] < lengths[:, None]
+        matrix_array[ys[valid], xx[valid], 1] = 255
+
+        result = Image.fromarray(matrix_array)
+        _save_jpeg(result, output_path)
+    except Exception:
+        shutil.copyfile(_ctx_path(input_path), output_path)
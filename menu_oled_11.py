@@ -0,0 +1,860 @@
+# -*- coding: utf-8 -*-
+"""SurrealCam: menu en pantalla OLED SSD1306 con botones por GPIO.
+
+Controla la camara (rpicam-still), aplica los filtros de filtros.py y
+envia las fotos por Bluetooth (obexftp) a un movil emparejado.
+
+El tiempo de cada frame de la OLED lo domina el bus I2C: conviene
+subirlo a 1 MHz en /boot/config.txt con
+
+    dtparam=i2c_arm_baudrate=1000000
+
+Al arrancar se comprueba la frecuencia del device-tree y se avisa por
+pantalla si el bus sigue por debajo de 400 kHz.
+"""
+
+import asyncio
+import glob
+import os
+import subprocess
+import time
+from collections import OrderedDict
+
+import pigpio
+from luma.core.interface.serial import i2c
+from luma.oled.device import ssd1306
+from PIL import Image, ImageDraw, ImageFont
+
+import filtros
+
+# --- Hardware ---------------------------------------------------------------
+
+BTN_UP = 17
+BTN_DOWN = 27
+BTN_ENTER = 22
+BTN_TAKE = 23
+
+PHOTO_DIR = "/home/fotos"
+MAC_ANDROID = "AA:BB:CC:DD:EE:FF"
+CANAL_OBEX = "12"
+
+# Con DEBUG la salida de rpicam-still y obexftp se hereda y sale por la
+# consola; en uso normal se descarta sin crear pipes ni decodificar nada
+DEBUG = False
+_SUB_OUT = None if DEBUG else asyncio.subprocess.DEVNULL
+
+# luma viene con smbus2; i2c_msg permite transacciones de tamano libre
+try:
+    from smbus2 import i2c_msg
+except ImportError:
+    i2c_msg = None
+
+
+class _I2CRafaga(i2c):
+    """Serial i2c de luma que manda cada data() en una sola transaccion.
+
+    El data() de serie trocea el framebuffer en bloques de 32 bytes, cada
+    uno con su START + direccion + STOP; el SSD1306 acepta un flujo
+    continuo tras un unico byte de control 0x40 (Co=0), asi que los 1024
+    bytes del frame viajan en una rafaga y se ahorra el peaje por bloque.
+    """
+
+    def data(self, data):
+        msg = i2c_msg.write(self._addr, bytes([0x40]) + bytes(data))
+        self._bus.i2c_rdwr(msg)
+
+
+if i2c_msg is not None:
+    serial = _I2CRafaga(port=1, address=0x3C)
+else:
+    serial = i2c(port=1, address=0x3C)
+
+# Framebuffer diferencial: display() calcula la caja que cambio respecto
+# al frame anterior y solo transmite esa ventana. Segun la version de
+# luma se pasa como instancia o no esta disponible.
+try:
+    from luma.core.framebuffer import diff_to_previous
+    device = ssd1306(serial, framebuffer=diff_to_previous())
+except (ImportError, TypeError):
+    device = ssd1306(serial)
+
+try:
+    font = ImageFont.truetype("DejaVuSans-Bold.ttf", 9)
+except OSError:
+    font = ImageFont.load_default()
+
+# Fuente grande de la cuenta atras, cargada una sola vez (abrir el TTF y
+# pasar por FreeType en cada segundo del timer era puro desperdicio)
+try:
+    FONT_BIG = ImageFont.truetype("DejaVuSans-Bold.ttf", 32)
+except OSError:
+    FONT_BIG = font
+
+pi = pigpio.pi()
+if not pi.connected:
+    raise SystemExit("No se pudo conectar con pigpiod")
+
+# Pulsaciones por interrupcion: pigpiod detecta el flanco de bajada y el
+# callback encola el pin; el bucle principal duerme bloqueado en la cola
+# en vez de despertarse cada 50 ms a leer los cuatro GPIO. El callback
+# llega en el hilo de pigpio, asi que cruza al bucle asyncio con
+# call_soon_threadsafe.
+eventos = asyncio.Queue()
+_loop = None
+
+
+def _btn_callback(gpio, level, tick):
+    if _loop is not None:
+        _loop.call_soon_threadsafe(eventos.put_nowait, gpio)
+
+
+_callbacks = []
+for _pin in (BTN_UP, BTN_DOWN, BTN_ENTER, BTN_TAKE):
+    pi.set_mode(_pin, pigpio.INPUT)
+    pi.set_pull_up_down(_pin, pigpio.PUD_UP)
+    # Antirrebote en el propio demonio: 25 ms de filtro de glitches, asi
+    # Python solo ve pulsaciones limpias
+    pi.set_glitch_filter(_pin, 25000)
+    _callbacks.append(pi.callback(_pin, pigpio.FALLING_EDGE, _btn_callback))
+
+
+def _i2c_baudrate():
+    """Frecuencia del bus I2C segun el device-tree, o None si no se lee."""
+    for ruta in glob.glob("/proc/device-tree/soc/i2c@*/clock-frequency"):
+        try:
+            with open(ruta, "rb") as f:
+                return int.from_bytes(f.read(4), "big")
+        except OSError:
+            pass
+    return None
+
+
+def _drain_eventos():
+    """Descarta pulsaciones acumuladas durante una operacion larga."""
+    try:
+        while True:
+            eventos.get_nowait()
+    except asyncio.QueueEmpty:
+        pass
+
+
+async def _en_hilo(fn, *args):
+    """Ejecuta una funcion bloqueante (filtros, E/S) fuera del bucle."""
+    return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+# --- Estado del menu --------------------------------------------------------
+
+# Tuplas y no listas: los menus son constantes y varias caches de dibujo
+# los usan como clave por identidad, que asi queda garantizada
+menu_options = ("Tomar Foto", "Filtros", "Timer", "Enviar Foto",
+                "Enviar Todas", "Borrar Fotos", "Apagar")
+submenu_filtros_options = ("Normal", "Grano Analogico", "Glitch Digital",
+                           "Rojo Contraste", "Sepia Contraste",
+                           "Azul Contraste", "Espiral", "Wes Anderson",
+                           "Matrix Simple", "Matrix Verde", "Negativo",
+                           "Volver")
+submenu_timer_options = ("Sin Timer", "3 segundos", "5 segundos",
+                         "10 segundos", "Volver")
+
+selected_index = 0
+menu_offset = 0
+submenu_active = None          # None, "filtros" o "timer"
+filtro_seleccionado = "Normal"
+timer_segundos = 0
+bluetooth_active = False
+running = True
+
+VISIBLE_LINES = 3
+
+
+# --- Dibujo -----------------------------------------------------------------
+
+def get_text_size(draw, text, fnt):
+    """Ancho y alto en pixeles de un texto."""
+    bbox = draw.textbbox((0, 0), text, font=fnt)
+    return bbox[2] - bbox[0], bbox[3] - bbox[1]
+
+
+# Glifos ya rasterizados por (caracter, fuente): FreeType solo renderiza
+# cada caracter una vez y el resto son pegados de imagenes diminutas
+_glyph_cache = {}
+
+
+def _glyph(ch, fnt):
+    entry = _glyph_cache.get((ch, fnt))
+    if entry is None:
+        w = int(fnt.getlength(ch)) + 1
+        asc, desc = fnt.getmetrics()
+        tile = Image.new("1", (max(w, 1), asc + desc), "black")
+        ImageDraw.Draw(tile).text((0, 0), ch, font=fnt, fill="white")
+        entry = (tile, fnt.getlength(ch))
+        _glyph_cache[(ch, fnt)] = entry
+    return entry
+
+
+def _texto(img, xy, text, fnt=None):
+    """Como draw.text pero pegando glifos cacheados (se pierde el kerning,
+    irrelevante a 9 px sobre la OLED)."""
+    fnt = fnt or font
+    x, y = xy
+    for ch in text:
+        tile, adv = _glyph(ch, fnt)
+        img.paste(tile, (int(x), y), tile)
+        x += adv
+
+
+# Digitos de la cuenta atras pre-rasterizados a 32 px: el primer segundo
+# del timer no paga el render grande
+for _d in "0123456789":
+    _glyph(_d, FONT_BIG)
+
+
+# Avances por caracter para medir texto sin pasar por textbbox
+_charw = {}
+
+
+def _ancho_texto(text, fnt=None):
+    """Ancho en pixeles como suma de avances cacheados por caracter."""
+    fnt = fnt or font
+    total = 0
+    for ch in text:
+        w = _charw.get((ch, fnt))
+        if w is None:
+            w = fnt.getlength(ch)
+            _charw[(ch, fnt)] = w
+        total += w
+    return int(total)
+
+
+def _trunca_px(text, max_w):
+    """Trunca por ancho real en pixels, no por numero de caracteres."""
+    if _ancho_texto(text) <= max_w:
+        return text
+    recorte = max_w - _ancho_texto("...")
+    while text and _ancho_texto(text) > recorte:
+        text = text[:-1]
+    return text + "..."
+
+
+def _formatea_lineas(items):
+    """(lineas seleccionadas, no seleccionadas) ya truncadas por ancho."""
+    sel, unsel = [], []
+    max_w = device.width - 14
+    for s in items:
+        sel.append(_trunca_px(f"-> {s}", max_w))
+        unsel.append(_trunca_px(f"   {s}", max_w))
+    return sel, unsel
+
+
+# Las listas del menu son constantes: sus lineas finales (prefijo +
+# truncado) se calculan una vez y draw_menu solo indexa
+_menu_lineas = {
+    id(menu_options): _formatea_lineas(menu_options),
+    id(submenu_filtros_options): _formatea_lineas(submenu_filtros_options),
+    id(submenu_timer_options): _formatea_lineas(submenu_timer_options),
+}
+
+
+# Unico buffer de dibujo compartido por todas las pantallas (menu,
+# mensajes, spinner, cuenta atras, selector): cada frame lo limpia y lo
+# reusa en vez de asignar Image + ImageDraw nuevos. La clave del ultimo
+# frame del menu evita redibujar y reenviar cuando nada visible cambio
+# (~20 ms por framebuffer a 400 kHz).
+_ui_img = Image.new("1", (device.width, device.height))
+_ui_draw = ImageDraw.Draw(_ui_img)
+_last_frame_key = None
+
+
+def _display_otro(image):
+    """Muestra un frame ajeno al menu e invalida la cache de draw_menu."""
+    global _last_frame_key
+    _last_frame_key = None
+    device.display(image)
+
+
+# Marcos estaticos del menu (titulo + icono BT + flechas) ya dibujados,
+# por clave (titulo, bt, flecha arriba, flecha abajo): en cada pulsacion
+# solo se rasterizan las tres lineas de opciones.
+_chrome_cache = {}
+
+
+def _chrome(title, up, down):
+    """Base del menu con titulo, icono BT y flechas, cacheada."""
+    key = (title, bluetooth_active, up, down)
+    base = _chrome_cache.get(key)
+    if base is None:
+        base = Image.new("1", (device.width, device.height), "black")
+        d = ImageDraw.Draw(base)
+        d.text((2, 0), title, font=font, fill="white")
+        if bluetooth_active:
+            d.rectangle((device.width - 10, 1, device.width - 4, 8),
+                        outline="white", fill="white")
+        if up:
+            d.text((device.width - 10, 14), "^", font=font, fill="white")
+        if down:
+            d.text((device.width - 10, device.height - 12), "v",
+                   font=font, fill="white")
+        _chrome_cache[key] = base
+    return base
+
+
+# Frames del menu ya renderizados, por estado visible completo: volver a
+# un estado ya visto (subir y bajar por el mismo menu) no toca PIL.
+_frame_cache = OrderedDict()
+_FRAME_CACHE_MAX = 96
+
+
+def _render_menu_frame(items, title, sel_idx, off):
+    """Frame completo del menu para un estado dado, cacheado en LRU."""
+    key = (id(items), sel_idx, off, title, bluetooth_active)
+    frame = _frame_cache.get(key)
+    if frame is not None:
+        _frame_cache.move_to_end(key)
+        return frame
+
+    # El marco (titulo, icono BT, flechas) sale ya rasterizado de la
+    # cache; pegarlo limpia el frame entero y solo quedan por dibujar
+    # las tres lineas de opciones
+    frame = Image.new("1", (device.width, device.height))
+    up = off > 0
+    down = off + VISIBLE_LINES < len(items)
+    frame.paste(_chrome(title, up, down), (0, 0))
+
+    par = _menu_lineas.get(id(items))
+    if par is None:
+        par = _formatea_lineas(items)
+    sel, unsel = par
+
+    y = 14
+    for i in range(off, min(off + VISIBLE_LINES, len(items))):
+        _texto(frame, (2, y), sel[i] if i == sel_idx else unsel[i])
+        y += 16
+
+    _frame_cache[key] = frame
+    while len(_frame_cache) > _FRAME_CACHE_MAX:
+        _frame_cache.popitem(last=False)
+    return frame
+
+
+def draw_menu(items, title):
+    """Dibuja el titulo, el icono BT, las flechas y 3 opciones visibles."""
+    global _last_frame_key
+    key = (selected_index, menu_offset, id(items), title, bluetooth_active)
+    if key == _last_frame_key:
+        return
+
+    image = _render_menu_frame(items, title, selected_index, menu_offset)
+
+    # El framebuffer diferencial de luma ya reduce el envio a la zona que
+    # cambio (dos lineas cuando solo se mueve la seleccion)
+    device.display(image)
+    _last_frame_key = key
+
+
+def update_display():
+    if submenu_active == "filtros":
+        draw_menu(submenu_filtros_options, "Filtros")
+    elif submenu_active == "timer":
+        draw_menu(submenu_timer_options, "Timer")
+    else:
+        draw_menu(menu_options, "Menu")
+
+
+# Pre-render de todos los estados alcanzables de los tres menus (~50
+# frames, ~50 KB) al importar: navegar es entonces puro envio I2C, sin
+# trabajo de PIL ni en la primera pasada. Se rellenan con el icono BT
+# apagado, que es el estado de arranque; un frame con BT activo se
+# renderiza al vuelo y cabe igual en la cache.
+for _items, _title in ((menu_options, "Menu"),
+                       (submenu_filtros_options, "Filtros"),
+                       (submenu_timer_options, "Timer")):
+    for _off in range(max(0, len(_items) - VISIBLE_LINES) + 1):
+        for _sel in range(_off, min(_off + VISIBLE_LINES, len(_items))):
+            _render_menu_frame(_items, _title, _sel, _off)
+
+
+# Iconos 8x8 dibujados a mano (un byte por fila, bit alto a la izquierda).
+# Los emoji de los mensajes de estado obligaban a FreeType a buscar
+# codepoints que DejaVuSans-Bold no tiene y a resolver el glifo de
+# respaldo en cada mensaje; estos bitmaps se pegan tal cual.
+_ICONS = {
+    "camera": Image.frombytes(
+        "1", (8, 8), bytes((0x00, 0x38, 0x7E, 0x66, 0x5A, 0x66, 0x7E, 0x00))),
+    "ok": Image.frombytes(
+        "1", (8, 8), bytes((0x00, 0x02, 0x04, 0x08, 0x88, 0x50, 0x20, 0x00))),
+    "hourglass": Image.frombytes(
+        "1", (8, 8), bytes((0x00, 0x7E, 0x3C, 0x18, 0x18, 0x3C, 0x7E, 0x00))),
+}
+
+
+def draw_icon(img, x, y, name):
+    """Pega uno de los iconos 8x8 pre-dibujados."""
+    img.paste(_ICONS[name], (x, y))
+
+
+# Los mensajes ("Listo!", "No hay fotos"...) se repiten mucho: el ajuste
+# de linea de cada texto se calcula una sola vez
+_wrap_cache = {}
+
+
+def _ajusta_lineas(text):
+    """Parte un texto en lineas que caben en pantalla, con cache."""
+    lines = _wrap_cache.get(text)
+    if lines is not None:
+        return lines
+
+    # Ajuste de linea sumando anchos cacheados: nada de textbbox sobre la
+    # linea acumulada en cada palabra
+    max_w = device.width - 4
+    space_w = _ancho_texto(" ")
+    lines = []
+    current = ""
+    current_w = 0
+    for word in text.split():
+        word_w = _ancho_texto(word)
+        extra = word_w if not current else space_w + word_w
+        if current_w + extra <= max_w:
+            current = f"{current} {word}".strip()
+            current_w += extra
+        else:
+            lines.append(current)
+            current, current_w = word, word_w
+    if current:
+        lines.append(current)
+
+    _wrap_cache[text] = lines
+    return lines
+
+
+async def show_message(text, duration=2, icon=None):
+    """Mensaje centrado con ajuste de linea por palabras e icono opcional."""
+    image = _ui_img
+    _ui_draw.rectangle((0, 0, device.width, device.height), fill="black")
+
+    lines = _ajusta_lineas(text)
+
+    total_h = len(lines) * 12 + (12 if icon else 0)
+    y = (device.height - total_h) // 2
+    if icon:
+        draw_icon(image, (device.width - 8) // 2, y, icon)
+        y += 12
+    for line in lines:
+        w = _ancho_texto(line)
+        _texto(image, ((device.width - w) // 2, y), line)
+        y += 12
+
+    _display_otro(image)
+    await asyncio.sleep(duration)
+
+
+SPINNER = ["|", "/", "-", "\\"]
+
+
+def show_progress(text, step):
+    """Texto con un spinner giratorio debajo."""
+    image = _ui_img
+    _ui_draw.rectangle((0, 0, device.width, device.height), fill="black")
+
+    w = _ancho_texto(text)
+    _texto(image, ((device.width - w) // 2, 20), text)
+
+    spin = SPINNER[step % len(SPINNER)]
+    w = _ancho_texto(spin)
+    _texto(image, ((device.width - w) // 2, 40), spin)
+
+    _display_otro(image)
+
+
+async def _spinner(text):
+    """Spinner animado mientras otra tarea trabaja; cancelar para parar."""
+    step = 0
+    while True:
+        show_progress(text, step)
+        step += 1
+        await asyncio.sleep(0.1)
+
+
+# --- Camara y fotos ---------------------------------------------------------
+
+# El espacio libre apenas cambia entre disparos seguidos: el resultado
+# se reutiliza durante 10 s antes de volver a preguntar al sistema
+_df_cache_ok = True
+_df_cache_ts = 0.0
+_DF_TTL = 10.0
+
+
+def check_disk_space_safe():
+    """check_disk_space de filtros, cacheado 10 s y a prueba de firmas viejas."""
+    global _df_cache_ok, _df_cache_ts
+    now = time.monotonic()
+    if now - _df_cache_ts < _DF_TTL:
+        return _df_cache_ok
+    try:
+        ok = filtros.check_disk_space(PHOTO_DIR)
+    except TypeError:
+        try:
+            stat = os.statvfs(PHOTO_DIR)
+            free_mb = (stat.f_bavail * stat.f_frsize) / (1024 * 1024)
+            ok = free_mb > 50
+        except OSError:
+            ok = True
+    _df_cache_ok = ok
+    _df_cache_ts = now
+    return ok
+
+
+# Ultimo proceso de camara lanzado: basta con vigilarlo a el en lugar de
+# forkear un pkill que rastree /proc entero antes de cada foto
+_cam_proc = None
+
+
+async def take_current_photo():
+    """Cuenta atras (si hay timer) y dispara la camara."""
+    global _cam_proc
+    if timer_segundos > 0:
+        asc, desc = FONT_BIG.getmetrics()
+        for i in range(timer_segundos, 0, -1):
+            image = _ui_img
+            _ui_draw.rectangle((0, 0, device.width, device.height),
+                               fill="black")
+            texto = str(i)
+            w = _ancho_texto(texto, FONT_BIG)
+            _texto(image, ((device.width - w) // 2,
+                           (device.height - (asc + desc)) // 2),
+                   texto, FONT_BIG)
+            _display_otro(image)
+            await asyncio.sleep(1)
+
+    timestamp = time.strftime("%Y%m%d_%H%M%S")
+    base_file = os.path.join(PHOTO_DIR, f"foto_{timestamp}.jpg")
+
+    cmd = ["rpicam-still", "-o", base_file, "--width", "2304",
+           "--height", "1296", "-t", "2000", "-n"]
+    proc = await asyncio.create_subprocess_exec(
+        *cmd, stdout=_SUB_OUT, stderr=_SUB_OUT)
+    _cam_proc = proc
+    try:
+        await asyncio.wait_for(proc.wait(), timeout=15)
+    except asyncio.TimeoutError:
+        proc.kill()
+        raise
+    if proc.returncode != 0:
+        return None
+    return base_file
+
+
+# Filtro elegible en el menu -> (sufijo del fichero, funcion, args extra).
+# Una consulta de diccionario en vez de diez comparaciones encadenadas;
+# "Normal" no aparece: la foto base ya es el resultado.
+FILTER_TABLE = {
+    "Grano Analogico": ("_grano.jpg", filtros.filtro_grano_analogico, (20,)),
+    "Glitch Digital": ("_glitch.jpg", filtros.filtro_glitch_digital, ()),
+    "Rojo Contraste": ("_rojo.jpg", filtros.filtro_rojo_contraste, ()),
+    "Sepia Contraste": ("_sepia.jpg", filtros.filtro_sepia_contraste, ()),
+    "Azul Contraste": ("_azul.jpg", filtros.filtro_azul_contraste, ()),
+    "Espiral": ("_espiral.jpg", filtros.filtro_espiral, ()),
+    "Wes Anderson": ("_wes.jpg", filtros.filtro_wes_anderson, ()),
+    "Matrix Simple": ("_matrix.jpg", filtros.filtro_matrix_simple, ()),
+    "Matrix Verde": ("_mverde.jpg", filtros.filtro_matrix_verde, ()),
+    "Negativo": ("_neg.jpg", filtros.filtro_negativo, ()),
+}
+
+
+async def take_photo():
+    """Remata la camara anterior si sigue viva y saca la foto con filtro."""
+    if _cam_proc is not None and _cam_proc.returncode is None:
+        _cam_proc.terminate()
+        await _cam_proc.wait()
+        await asyncio.sleep(0.5)
+
+    if not check_disk_space_safe():
+        await show_message("Sin espacio en disco")
+        return
+
+    await show_message("Preparando...", 1, icon="camera")
+    try:
+        base_file = await take_current_photo()
+    except asyncio.TimeoutError:
+        await show_message("Timeout", icon="hourglass")
+        return
+    if base_file is None:
+        await show_message("Error camara")
+        return
+
+    final_file = base_file
+    entrada = FILTER_TABLE.get(filtro_seleccionado)
+    if entrada is not None:
+        sufijo, fn, extra = entrada
+        final_file = base_file.replace(".jpg", sufijo)
+        try:
+            await _en_hilo(fn, base_file, final_file, *extra)
+        except Exception:
+            final_file = base_file
+
+    if final_file != base_file and os.path.exists(final_file):
+        os.remove(base_file)
+
+    await show_message("Listo!", icon="ok")
+
+
+# Lista de fotos cacheada: el mtime del directorio cambia con cualquier
+# alta o baja, asi que sirve de clave de invalidacion barata (un stat
+# frente a un scandir completo por visita al menu)
+_photos_cache = {"mtime": None, "files": []}
+
+
+def list_photos():
+    """Nombres de las fotos del directorio, ordenados y cacheados por mtime."""
+    try:
+        mtime = os.stat(PHOTO_DIR).st_mtime
+    except OSError:
+        return []
+    if mtime != _photos_cache["mtime"]:
+        # scandir devuelve entradas con nombre y tipo ya cacheados, sin
+        # un stat extra por fichero como listdir + join
+        with os.scandir(PHOTO_DIR) as it:
+            _photos_cache["files"] = sorted(
+                e.name for e in it
+                if e.is_file() and e.name.lower().endswith(".jpg"))
+        _photos_cache["mtime"] = mtime
+    return _photos_cache["files"]
+
+
+async def delete_photos():
+    """Borra todas las fotos del directorio."""
+    files = list_photos()
+    if not files:
+        await show_message("No hay fotos")
+        return
+
+    # Con el directorio abierto una vez, cada borrado es un unlinkat(2)
+    # por nombre: el kernel se ahorra resolver /home/fotos/<n> entero
+    # para cada foto
+    dfd = os.open(PHOTO_DIR, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        step = 0
+        for name in files:
+            show_progress("Borrando...", step)
+            os.unlink(name, dir_fd=dfd)
+            step += 1
+    finally:
+        os.close(dfd)
+
+    await show_message(f"{len(files)} fotos borradas")
+
+
+async def send_photo(path):
+    """Envia una foto por Bluetooth con obexftp sin congelar el menu."""
+    proceso = await asyncio.create_subprocess_exec(
+        "obexftp", "--nopath", "--noconn", "--uuid", "none",
+        "-b", MAC_ANDROID, "-B", CANAL_OBEX, "-p", path,
+        stdout=_SUB_OUT, stderr=_SUB_OUT)
+    try:
+        await asyncio.wait_for(proceso.wait(), timeout=240)
+    except asyncio.TimeoutError:
+        proceso.kill()
+        return False
+    return proceso.returncode == 0
+
+
+async def send_single_photo_menu():
+    """Selector de foto para enviar por Bluetooth."""
+    files = list_photos()
+    if not files:
+        await show_message("No hay fotos")
+        return
+
+    # Las lineas fijas (titulo y ayuda) se rasterizan una sola vez; cada
+    # redibujo parte de una copia y solo anade el contador y el nombre
+    base = Image.new("1", (device.width, device.height), "black")
+    _texto(base, (2, 0), "Enviar Foto")
+    _texto(base, (2, 42), "ENTER: enviar")
+    _texto(base, (2, 52), "FOTO: salir")
+
+    index = 0
+    last_index = None
+    while True:
+        # Solo se redibuja cuando cambia la foto seleccionada; el resto de
+        # eventos no tocan la pantalla
+        if index != last_index:
+            image = _ui_img
+            image.paste(base, (0, 0))
+            _texto(image, (2, 14), f"{index + 1}/{len(files)}")
+            _texto(image, (2, 28), _trunca_px(files[index], device.width - 4))
+            _display_otro(image)
+            last_index = index
+
+        pin = await eventos.get()
+        if pin == BTN_UP:
+            index = (index - 1) % len(files)
+        elif pin == BTN_DOWN:
+            index = (index + 1) % len(files)
+        elif pin == BTN_ENTER:
+            # El spinner sigue girando mientras obexftp trabaja: el envio
+            # ya no bloquea el bucle de eventos
+            tarea = asyncio.ensure_future(_spinner("Enviando..."))
+            ok = await send_photo(os.path.join(PHOTO_DIR, files[index]))
+            tarea.cancel()
+            if ok:
+                await show_message("Enviada!", icon="ok")
+            else:
+                await show_message("Error al enviar")
+            return
+        elif pin == BTN_TAKE:
+            return
+
+
+async def send_all_photos():
+    """Envia todas las fotos en una sola invocacion de obexftp."""
+    files = list_photos()
+    if not files:
+        await show_message("No hay fotos")
+        return
+
+    # obexftp acepta varios -p: una sola invocacion amortiza el
+    # establecimiento de la conexion (RFCOMM + OBEX, ~1-2 s) entre todas
+    # las fotos en vez de pagarlo por cada una
+    cmd = ["obexftp", "--nopath", "--noconn", "--uuid", "none",
+           "-b", MAC_ANDROID, "-B", CANAL_OBEX]
+    for name in files:
+        cmd += ["-p", os.path.join(PHOTO_DIR, name)]
+
+    tarea = asyncio.ensure_future(_spinner(f"Enviando {len(files)}..."))
+    proceso = await asyncio.create_subprocess_exec(
+        *cmd, stdout=_SUB_OUT, stderr=_SUB_OUT)
+    try:
+        # El margen crece con el numero de fotos: la conexion se paga una
+        # vez, la transferencia una por foto
+        await asyncio.wait_for(proceso.wait(),
+                               timeout=60 + 60 * len(files))
+    except asyncio.TimeoutError:
+        proceso.kill()
+        tarea.cancel()
+        await show_message("Timeout al enviar")
+        return
+    tarea.cancel()
+    if proceso.returncode == 0:
+        await show_message(f"{len(files)} enviadas!", icon="ok")
+    else:
+        await show_message("Error al enviar")
+
+
+# --- Navegacion -------------------------------------------------------------
+
+def current_items():
+    if submenu_active == "filtros":
+        return submenu_filtros_options
+    if submenu_active == "timer":
+        return submenu_timer_options
+    return menu_options
+
+
+def scroll_up():
+    global selected_index, menu_offset
+    items = current_items()
+    selected_index = (selected_index - 1) % len(items)
+    if selected_index < menu_offset:
+        menu_offset = selected_index
+    elif selected_index >= menu_offset + VISIBLE_LINES:
+        menu_offset = selected_index - VISIBLE_LINES + 1
+
+
+def scroll_down():
+    global selected_index, menu_offset
+    items = current_items()
+    selected_index = (selected_index + 1) % len(items)
+    if selected_index < menu_offset:
+        menu_offset = selected_index
+    elif selected_index >= menu_offset + VISIBLE_LINES:
+        menu_offset = selected_index - VISIBLE_LINES + 1
+
+
+async def select_option():
+    global submenu_active, selected_index, menu_offset
+    global filtro_seleccionado, timer_segundos, running
+
+    if submenu_active == "filtros":
+        option = submenu_filtros_options[selected_index]
+        if option != "Volver":
+            filtro_seleccionado = option
+            await show_message(f"Filtro: {option}", 1)
+        submenu_active = None
+        selected_index = 0
+        menu_offset = 0
+    elif submenu_active == "timer":
+        option = submenu_timer_options[selected_index]
+        if option == "3 segundos":
+            timer_segundos = 3
+        elif option == "5 segundos":
+            timer_segundos = 5
+        elif option == "10 segundos":
+            timer_segundos = 10
+        elif option == "Sin Timer":
+            timer_segundos = 0
+        submenu_active = None
+        selected_index = 0
+        menu_offset = 0
+    else:
+        option = menu_options[selected_index]
+        if option == "Tomar Foto":
+            await take_photo()
+        elif option == "Filtros":
+            submenu_active = "filtros"
+            selected_index = 0
+            menu_offset = 0
+        elif option == "Timer":
+            submenu_active = "timer"
+            selected_index = 0
+            menu_offset = 0
+        elif option == "Enviar Foto":
+            await send_single_photo_menu()
+        elif option == "Enviar Todas":
+            await send_all_photos()
+        elif option == "Borrar Fotos":
+            await delete_photos()
+        elif option == "Apagar":
+            await show_message("Apagando...", 1)
+            running = False
+            subprocess.run(["sudo", "shutdown", "-h", "now"])
+
+
+# --- Bucle principal --------------------------------------------------------
+
+dispatch = {
+    BTN_UP: scroll_up,
+    BTN_DOWN: scroll_down,
+    BTN_ENTER: select_option,
+    BTN_TAKE: take_photo,
+}
+
+
+async def main():
+    global _loop
+    _loop = asyncio.get_running_loop()
+    os.makedirs(PHOTO_DIR, exist_ok=True)
+
+    baud = _i2c_baudrate()
+    if baud is not None and baud < 400000:
+        await show_message("I2C lento: sube i2c_arm_baudrate", 3)
+
+    update_display()
+
+    while running:
+        pin = await eventos.get()
+        resultado = dispatch[pin]()
+        if asyncio.iscoroutine(resultado):
+            await resultado
+        if pin in (BTN_ENTER, BTN_TAKE):
+            # Lo pulsado mientras la camara o el Bluetooth trabajaban no
+            # debe ejecutarse de golpe al volver al menu
+            _drain_eventos()
+        update_display()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        pi.stop()